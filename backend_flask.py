@@ -12,13 +12,35 @@ For MySQL: pip install flask-mysqlconnector
 For SQLite: No additional install needed
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, redirect, send_from_directory
 import sqlite3
-from datetime import date, datetime
+import json
+import time
+import hashlib
+import http.client
+import io
+import re
+import csv
+import heapq
+import ipaddress
+import itertools
+import socket
+import sys
+import threading
+import urllib.parse
+import uuid
+import urllib.request
+from datetime import date, datetime, timedelta, timezone
 import os
 from dotenv import load_dotenv
 from flask_cors import CORS
 
+# Optional: pip install Pillow to shrink cached product images to thumbnails
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
 load_dotenv()
 
 app = Flask(__name__)
@@ -27,10 +49,11 @@ CORS(app)  # Enable CORS for all routes
 # ============================================
 # DATABASE CONNECTION
 # ============================================
-def get_db_connection():
+def get_db_connection(check_same_thread=True):
     """Create database connection - using SQLite for new database"""
     # SQLite connection for new database
-    conn = sqlite3.connect('inventory_new.db')
+    # timeout: wait for a concurrent writer instead of failing with "database is locked"
+    conn = sqlite3.connect('inventory_new.db', timeout=30, check_same_thread=check_same_thread)
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -57,6 +80,99 @@ def get_db_connection():
     # return conn
 
 
+def ensure_schema():
+    """Add tables and columns introduced after init_db.py was first run to an existing database"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    # WAL lets readers keep going while a sale holds the write lock
+    cur.execute('PRAGMA journal_mode = WAL')
+    for table in ('products', 'suppliers'):
+        cur.execute(f'PRAGMA table_info({table})')
+        columns = [row['name'] for row in cur.fetchall()]
+        if columns and 'version' not in columns:
+            cur.execute(f'ALTER TABLE {table} ADD COLUMN version INTEGER DEFAULT 1')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS stock_holds (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cart_id TEXT NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            expires_at TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+        )
+    ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_stock_holds_product ON stock_holds (product_id, expires_at)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_stock_holds_cart ON stock_holds (cart_id)')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            payload TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS thumbnails (
+            url TEXT PRIMARY KEY,
+            digest TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            content_type TEXT,
+            last_access REAL NOT NULL
+        )
+    ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_thumbnails_last_access ON thumbnails (last_access)')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task TEXT NOT NULL,
+            params TEXT,
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress REAL DEFAULT 0,
+            message TEXT,
+            result TEXT,
+            error TEXT,
+            cancel_requested INTEGER DEFAULT 0,
+            schedule_name TEXT,
+            worker TEXT,
+            run_at TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            started_at TEXT,
+            finished_at TEXT,
+            heartbeat_at TEXT
+        )
+    ''')
+    cur.execute('PRAGMA table_info(jobs)')
+    if 'heartbeat_at' not in [row['name'] for row in cur.fetchall()]:
+        cur.execute('ALTER TABLE jobs ADD COLUMN heartbeat_at TEXT')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, run_at)')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS job_schedules (
+            name TEXT PRIMARY KEY,
+            task TEXT NOT NULL,
+            cron TEXT NOT NULL,
+            params TEXT,
+            enabled INTEGER DEFAULT 1,
+            next_run_at TEXT
+        )
+    ''')
+    cur.executemany('''
+        INSERT OR IGNORE INTO job_schedules (name, task, cron, params)
+        VALUES (?, ?, ?, ?)
+    ''', [
+        ('nightly-optimize', 'optimize', '0 3 * * *', '{}'),
+        ('hourly-prune', 'prune', '@hourly', '{"keep_days": 30}')
+    ])
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+ensure_schema()
+
+
 # Helper to serialize dates
 def serialize_row(row):
     if row is None:
@@ -68,17 +184,189 @@ def serialize_row(row):
     return result
 
 
+# ============================================
+# PARTIAL UPDATES / OPTIMISTIC CONCURRENCY
+# ============================================
+
+def is_int(value):
+    return type(value) is int  # bool is a subclass of int; reject it
+
+
+def is_number(value):
+    return type(value) in (int, float)
+
+
+def is_text(value):
+    return isinstance(value, str) and value.strip() != ''
+
+
+def is_optional_text(value):
+    return value is None or isinstance(value, str)
+
+
+# Columns a client may change through PATCH, with the check each value must pass
+PRODUCT_PATCH_FIELDS = {
+    'name': is_text,
+    'sku': is_text,
+    'category': is_optional_text,
+    'quantity': is_int,
+    'unit_price': is_number,
+    'reorder_level': is_int,
+    'image_url': is_optional_text,
+    'description': is_optional_text,
+}
+SUPPLIER_PATCH_FIELDS = {
+    'name': is_text,
+    'contact_person': is_optional_text,
+    'email': is_optional_text,
+    'phone': is_optional_text,
+    'address': is_optional_text,
+    'outstanding_balance': is_number,
+}
+
+
+def patch_error(data, allowed_fields):
+    """Why a PATCH body can't be applied, or None if it can"""
+    unknown = [key for key in data if key not in allowed_fields and key not in ('id', 'version')]
+    if unknown or not any(key in allowed_fields for key in data):
+        return 'Only these fields can be patched: ' + ', '.join(allowed_fields)
+    invalid = [key for key in data if key in allowed_fields and not allowed_fields[key](data[key])]
+    if invalid:
+        return 'Invalid value for: ' + ', '.join(invalid)
+    if data.get('version') is not None and not is_int(data['version']):
+        return 'version must be an integer'
+    return None
+
+
+def with_etag(row, status=200):
+    """JSON response for a versioned row with its ETag header set"""
+    response = jsonify(row)
+    response.status_code = status
+    if row is not None and row.get('version') is not None:
+        response.set_etag(str(row['version']))
+    return response
+
+
+def expected_version(data):
+    """Version the client last saw: If-Match header first, then 'version' in the body"""
+    if request.if_match and not request.if_match.star_tag:
+        tags = request.if_match.as_set()
+        if len(tags) != 1:
+            raise ValueError('If-Match must contain exactly one ETag')
+        return int(tags.pop())
+    if data.get('version') is not None:
+        if not is_int(data['version']):
+            raise ValueError('version must be an integer')
+        return data['version']
+    return None
+
+
+def patch_row(cur, table, id, data, allowed_fields, version=None):
+    """
+    Update only the supplied columns and bump the row version.
+    SQL: UPDATE <table> SET col = ?, ..., version = version + 1 WHERE id = ? [AND version = ?]
+    Returns None on success, otherwise 'invalid', 'not_found' or 'conflict'.
+    """
+    if patch_error(data, allowed_fields) is not None:
+        return 'invalid'
+    fields = [key for key in data if key in allowed_fields]
+
+    assignments = ', '.join(f'{field} = ?' for field in fields)
+    params = [data[field] for field in fields] + [id]
+    sql = f'''
+        UPDATE {table}
+        SET {assignments}, version = version + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    '''
+    if version is not None:
+        sql += ' AND version = ?'
+        params.append(version)
+    cur.execute(sql, params)
+
+    if cur.rowcount == 0:
+        cur.execute(f'SELECT 1 FROM {table} WHERE id = ?', (id,))
+        return 'conflict' if cur.fetchone() else 'not_found'
+    record_row_change(cur, table, id, fields + ['version'])
+    return None
+
+
+def patch_response(table, id, allowed_fields, not_found_message):
+    """Shared body of the single-row PATCH routes"""
+    data = request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    try:
+        version = expected_version(data)
+    except ValueError:
+        return jsonify({'error': 'Invalid version or If-Match header'}), 400
+    error = patch_error(data, allowed_fields)
+    if error is not None:
+        return jsonify({'error': error}), 400
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        error = patch_row(cur, table, id, data, allowed_fields, version)
+    except sqlite3.IntegrityError as e:
+        conn.rollback()
+        cur.close()
+        conn.close()
+        return jsonify({'error': str(e), 'id': id}), 409
+    if error is not None:
+        conn.rollback()
+        cur.close()
+        conn.close()
+        if error == 'not_found':
+            return jsonify({'error': not_found_message}), 404
+        return jsonify({'error': 'Version conflict - reload and retry'}), 412
+
+    cur.execute(f'SELECT * FROM {table} WHERE id = ?', (id,))
+    row = serialize_row(cur.fetchone())
+    conn.commit()
+    cur.close()
+    conn.close()
+    return with_etag(row)
+
+
 # ============================================
 # PRODUCTS API
 # ============================================
 
+PRODUCT_COLUMNS = ('id', 'name', 'sku', 'category', 'quantity', 'unit_price', 'reorder_level',
+                   'image_url', 'description', 'version', 'created_at', 'updated_at')
+
+
+def projection(allowed_columns):
+    """
+    Column list for SELECT from ?fields=id,name,sku (default: all columns).
+    Raises ValueError on a field that is not a column, so the name is safe to put in SQL.
+    """
+    fields = request.args.get('fields')
+    if not fields:
+        return '*'
+    columns = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [column for column in columns if column not in allowed_columns]
+    if unknown or not columns:
+        raise ValueError('Unknown fields: ' + ', '.join(unknown) if unknown else 'No fields given')
+    return ', '.join(dict.fromkeys(columns))
+
+
+def projected_columns(columns):
+    """Column names behind a projection() result"""
+    return PRODUCT_COLUMNS if columns == '*' else tuple(columns.split(', '))
+
+
 @app.route('/api/products', methods=['GET'])
 def get_products():
-    """Get all products - SQL: SELECT * FROM products ORDER BY created_at DESC"""
+    """Get all products - SQL: SELECT <fields or *> FROM products ORDER BY created_at DESC"""
     try:
+        try:
+            columns = projection(PRODUCT_COLUMNS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         conn = get_db_connection()
         cur = conn.cursor()
-        cur.execute('SELECT * FROM products ORDER BY created_at DESC')
+        cur.execute(f'SELECT {columns} FROM products ORDER BY created_at DESC')
         products = [serialize_row(row) for row in cur.fetchall()]
         cur.close()
         conn.close()
@@ -89,17 +377,25 @@ def get_products():
 
 @app.route('/api/products/<int:id>', methods=['GET'])
 def get_product(id):
-    """Get single product - SQL: SELECT * FROM products WHERE id = ?"""
+    """Get single product - SQL: SELECT <fields or *> FROM products WHERE id = ?"""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute('SELECT * FROM products WHERE id = ?', (id,))
-        product = serialize_row(cur.fetchone())
-        cur.close()
-        conn.close()
+        try:
+            columns = projection(PRODUCT_COLUMNS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if CATALOG_INDEX_ENABLED:
+            record = catalog.get(id)
+            product = None if record is None else record.to_dict(projected_columns(columns))
+        else:
+            conn = get_db_connection()
+            cur = conn.cursor()
+            cur.execute(f'SELECT {columns} FROM products WHERE id = ?', (id,))
+            product = serialize_row(cur.fetchone())
+            cur.close()
+            conn.close()
         if product is None:
             return jsonify({'error': 'Product not found'}), 404
-        return jsonify(product)
+        return with_etag(product)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -131,27 +427,32 @@ def create_product():
         product_id = cur.lastrowid
         cur.execute('SELECT * FROM products WHERE id = ?', (product_id,))
         product = serialize_row(cur.fetchone())
+        record_change(cur, 'products', product_id, 'insert', product)
         conn.commit()
         cur.close()
         conn.close()
-        return jsonify(product), 201
+        return with_etag(product, 201)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/api/products/<int:id>', methods=['PUT'])
 def update_product(id):
-    """Update product - SQL: UPDATE products SET ... WHERE id = $1"""
+    """Update product - SQL: UPDATE products SET ... WHERE id = ? [AND version = ?]"""
     try:
         data = request.get_json()
+        try:
+            version = expected_version(data)
+        except ValueError:
+            return jsonify({'error': 'Invalid version or If-Match header'}), 400
         conn = get_db_connection()
         cur = conn.cursor()
         cur.execute('''
             UPDATE products
             SET name = ?, sku = ?, category = ?, quantity = ?,
                 unit_price = ?, reorder_level = ?, image_url = ?,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
+                version = version + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND (? IS NULL OR version = ?)
         ''', (
             data['name'],
             data['sku'],
@@ -160,16 +461,82 @@ def update_product(id):
             data.get('unit_price', 0),
             data.get('reorder_level', 10),
             data.get('image_url', ''),
-            id
+            id,
+            version,
+            version
         ))
+        if cur.rowcount == 0:
+            cur.execute('SELECT 1 FROM products WHERE id = ?', (id,))
+            exists = cur.fetchone() is not None
+            conn.rollback()
+            cur.close()
+            conn.close()
+            if exists:
+                return jsonify({'error': 'Version conflict - reload and retry'}), 412
+            return jsonify({'error': 'Product not found'}), 404
         cur.execute('SELECT * FROM products WHERE id = ?', (id,))
         product = serialize_row(cur.fetchone())
+        record_change(cur, 'products', id, 'update', product)
         conn.commit()
         cur.close()
         conn.close()
-        if product is None:
-            return jsonify({'error': 'Product not found'}), 404
-        return jsonify(product)
+        return with_etag(product)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/products/<int:id>', methods=['PATCH'])
+def patch_product(id):
+    """Partial update - SQL: UPDATE products SET <supplied columns> WHERE id = ? AND version = ?"""
+    try:
+        return patch_response('products', id, PRODUCT_PATCH_FIELDS, 'Product not found')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/products', methods=['PATCH'])
+def bulk_patch_products():
+    """
+    Apply many partial updates in one transaction (all or nothing).
+    Body: [{"id": 1, "unit_price": 9.99, "version": 3}, ...] or {"items": [...]}
+    """
+    try:
+        data = request.get_json()
+        items = data.get('items') if isinstance(data, dict) else data
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'A non-empty list of updates is required'}), 400
+        if not all(isinstance(item, dict) and is_int(item.get('id')) for item in items):
+            return jsonify({'error': 'Every update needs an integer id'}), 400
+        invalid = [item['id'] for item in items if patch_error(item, PRODUCT_PATCH_FIELDS) is not None]
+        if invalid:
+            return jsonify({'error': 'No updates applied: invalid fields or values', 'invalid': invalid}), 400
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+        failed = {'invalid': [], 'not_found': [], 'conflict': []}
+        for item in items:
+            try:
+                error = patch_row(cur, 'products', item['id'], item, PRODUCT_PATCH_FIELDS, item.get('version'))
+            except sqlite3.IntegrityError as e:
+                # e.g. a duplicate sku; release the write lock before replying
+                conn.rollback()
+                cur.close()
+                conn.close()
+                return jsonify({'error': f'No updates applied: {e}', 'id': item['id']}), 409
+            if error is not None:
+                failed[error].append(item['id'])
+
+        if any(failed.values()):
+            conn.rollback()
+            cur.close()
+            conn.close()
+            status = 412 if failed['conflict'] else 400 if failed['invalid'] else 404
+            return jsonify({'error': 'No updates applied', **failed}), status
+
+        conn.commit()
+        cur.close()
+        conn.close()
+        return jsonify({'updated': len(items)})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -181,6 +548,8 @@ def delete_product(id):
         conn = get_db_connection()
         cur = conn.cursor()
         cur.execute('DELETE FROM products WHERE id = ?', (id,))
+        if cur.rowcount:
+            record_change(cur, 'products', id, 'delete')
         conn.commit()
         cur.close()
         conn.close()
@@ -189,6 +558,443 @@ def delete_product(id):
         return jsonify({'error': str(e)}), 500
 
 
+# ============================================
+# PRODUCT CATALOG INDEX
+# ============================================
+
+# Optional in-memory copy of the products table for hot lookups by id/SKU.
+# Before each lookup it checks PRAGMA data_version (which changes whenever
+# any other connection or process commits) and, if it moved, re-reads only
+# the products named in change_log since the last sync.
+CATALOG_INDEX_ENABLED = os.getenv('CATALOG_INDEX', 'false').lower() == 'true'
+CATALOG_MAX_AGE_SECONDS = 300  # full reload also picks up writes made outside the API
+
+
+class ProductRecord:
+    """One product row; __slots__ keeps it far smaller than a dict or sqlite3.Row"""
+
+    __slots__ = PRODUCT_COLUMNS
+
+    def __init__(self, row):
+        for column in PRODUCT_COLUMNS:
+            setattr(self, column, row[column])
+        if self.category is not None:
+            self.category = sys.intern(self.category)
+
+    def slack(self):
+        """quantity - reorder_level; <= 0 means low stock, None if either is unset or not a number"""
+        if type(self.quantity) not in (int, float) or type(self.reorder_level) not in (int, float):
+            return None
+        return self.quantity - self.reorder_level
+
+    def to_dict(self, columns=PRODUCT_COLUMNS):
+        return {column: getattr(self, column) for column in columns}
+
+
+class CatalogIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.conn = None
+        self.by_id = {}
+        self.by_sku = {}
+        # Min-heap of (slack, tiebreak, record); entries for replaced or deleted
+        # records stay until the next rebuild and are skipped when read
+        self.low_stock_heap = []
+        self.stale_entries = 0
+        self.tiebreak = itertools.count()
+        self.data_version = None
+        self.last_seq = 0
+        self.loaded_at = 0
+
+    def get(self, id):
+        self.sync()
+        return self.by_id.get(id)
+
+    def get_by_sku(self, sku):
+        self.sync()
+        return self.by_sku.get(sku)
+
+    def low_stock(self):
+        """Records with quantity <= reorder_level, lowest slack first, without a table scan"""
+        self.sync()
+        with self.lock:
+            heap = self.low_stock_heap
+            found = []
+            # Entries with slack <= 0 form a subtree at the root of the heap
+            stack = [0]
+            while stack:
+                index = stack.pop()
+                if index >= len(heap) or heap[index][0] > 0:
+                    continue
+                record = heap[index][2]
+                if self.by_id.get(record.id) is record:
+                    found.append(record)
+                stack.extend((2 * index + 1, 2 * index + 2))
+        return sorted(found, key=lambda record: (record.slack(), record.id))
+
+    def sync(self):
+        with self.lock:
+            if self.conn is None:
+                self.conn = get_db_connection(check_same_thread=False)
+                self.load_all()
+                return
+            cur = self.conn.cursor()
+            cur.execute('PRAGMA data_version')
+            data_version = cur.fetchone()[0]
+            if time.time() - self.loaded_at > CATALOG_MAX_AGE_SECONDS:
+                self.load_all()
+            elif data_version != self.data_version:
+                self.data_version = data_version
+                self.apply_changes(cur)
+            cur.close()
+
+    def load_all(self):
+        cur = self.conn.cursor()
+        cur.execute('PRAGMA data_version')
+        self.data_version = cur.fetchone()[0]
+        self.last_seq = latest_seq(cur)
+        cur.execute(f'SELECT {", ".join(PRODUCT_COLUMNS)} FROM products')
+        self.by_id = {}
+        self.by_sku = {}
+        for row in cur.fetchall():
+            record = ProductRecord(row)
+            self.by_id[record.id] = record
+            self.by_sku[record.sku] = record
+        cur.close()
+        self.rebuild_heap()
+        self.loaded_at = time.time()
+
+    def apply_changes(self, cur):
+        """Reload the products touched since last_seq, or everything if the log has a gap"""
+        until = latest_seq(cur)
+        pruned = log_pruned_past(cur, self.last_seq)
+        changes = fetch_changes(cur, self.last_seq, 'products', CHANGE_PAGE_SIZE, until)
+        # Entries we never saw were pruned, or too much changed to patch up one by one
+        if pruned or len(changes) == CHANGE_PAGE_SIZE:
+            self.load_all()
+            return
+        ids = list({change['entity_id'] for change in changes})
+        if ids:
+            placeholders = ', '.join('?' * len(ids))
+            cur.execute(f'SELECT {", ".join(PRODUCT_COLUMNS)} FROM products WHERE id IN ({placeholders})', ids)
+            rows = {row['id']: row for row in cur.fetchall()}
+            for id in ids:
+                if id in rows:
+                    self.put(ProductRecord(rows[id]))
+                else:
+                    self.remove(id)
+        self.last_seq = until
+        if self.stale_entries > len(self.by_id) + 64:
+            self.rebuild_heap()
+
+    def put(self, record):
+        old = self.by_id.get(record.id)
+        if old is not None:
+            self.stale_entries += 1
+            if old.sku != record.sku and self.by_sku.get(old.sku) is old:
+                del self.by_sku[old.sku]
+        self.by_id[record.id] = record
+        self.by_sku[record.sku] = record
+        if record.slack() is not None:
+            heapq.heappush(self.low_stock_heap, (record.slack(), next(self.tiebreak), record))
+
+    def remove(self, id):
+        old = self.by_id.pop(id, None)
+        if old is not None:
+            self.stale_entries += 1
+            if self.by_sku.get(old.sku) is old:
+                del self.by_sku[old.sku]
+
+    def rebuild_heap(self):
+        self.low_stock_heap = [(record.slack(), next(self.tiebreak), record)
+                               for record in self.by_id.values() if record.slack() is not None]
+        heapq.heapify(self.low_stock_heap)
+        self.stale_entries = 0
+
+
+catalog = CatalogIndex()
+
+
+def missing_products(product_ids):
+    """Ids from product_ids that are not in the catalog index (syncs it once per call)"""
+    catalog.sync()
+    by_id = catalog.by_id
+    return [id for id in product_ids if id not in by_id]
+
+
+@app.route('/api/products/sku/<sku>', methods=['GET'])
+def get_product_by_sku(sku):
+    """Get single product by SKU - SQL: SELECT * FROM products WHERE sku = ?"""
+    try:
+        try:
+            columns = projection(PRODUCT_COLUMNS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if CATALOG_INDEX_ENABLED:
+            record = catalog.get_by_sku(sku)
+            product = None if record is None else record.to_dict(projected_columns(columns))
+        else:
+            conn = get_db_connection()
+            cur = conn.cursor()
+            cur.execute(f'SELECT {columns} FROM products WHERE sku = ?', (sku,))
+            product = serialize_row(cur.fetchone())
+            cur.close()
+            conn.close()
+        if product is None:
+            return jsonify({'error': 'Product not found'}), 404
+        return with_etag(product)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/products/low-stock', methods=['GET'])
+def get_low_stock_products():
+    """Products at or below their reorder level - SQL: SELECT * FROM products WHERE quantity <= reorder_level"""
+    try:
+        if CATALOG_INDEX_ENABLED:
+            return jsonify([record.to_dict() for record in catalog.low_stock()])
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute('''
+            SELECT * FROM products
+            WHERE quantity <= reorder_level
+            ORDER BY quantity - reorder_level, id
+        ''')
+        products = [serialize_row(row) for row in cur.fetchall()]
+        cur.close()
+        conn.close()
+        return jsonify(products)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# ============================================
+# PRODUCT THUMBNAILS
+# ============================================
+
+# Local copies of product images so list pages don't hit external image hosts.
+# Files are stored under their SHA-256 (content-addressed) and evicted
+# least-recently-used once the cache grows past THUMBNAIL_CACHE_MB.
+THUMBNAILS_ENABLED = os.getenv('THUMBNAILS_ENABLED', 'false').lower() == 'true'
+THUMBNAIL_DIR = os.getenv('THUMBNAIL_DIR', 'thumbnails')
+THUMBNAIL_CACHE_BYTES = int(os.getenv('THUMBNAIL_CACHE_MB', '200')) * 1024 * 1024
+THUMBNAIL_SIZE = (200, 200)
+THUMBNAIL_MAX_DOWNLOAD = 10 * 1024 * 1024
+THUMBNAIL_FETCH_TIMEOUT = 10
+THUMBNAIL_TOUCH_SECONDS = 60  # limits last_access writes on hot thumbnails
+DIGEST_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# Only raster formats are cached: they are served back from this API's own
+# origin, where an SVG (which can carry <script>) would be stored XSS.
+# The type is taken from the file's leading bytes, not the remote header.
+RASTER_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+
+def raster_type(content):
+    """MIME type of a JPEG/PNG/GIF/WebP image from its magic bytes, else None"""
+    if content[:4] == b'RIFF' and content[8:12] == b'WEBP':
+        return 'image/webp'
+    for signature, content_type in RASTER_SIGNATURES:
+        if content.startswith(signature):
+            return content_type
+    return None
+
+
+def public_address(hostname):
+    """
+    Resolve hostname and return an address to connect to; raise ValueError
+    unless every address it resolves to is public.
+    """
+    try:
+        addresses = socket.getaddrinfo(hostname, None, proto=socket.IPPROTO_TCP)
+    except socket.gaierror:
+        raise ValueError(f'Cannot resolve host {hostname}')
+    for address in addresses:
+        ip = ipaddress.ip_address(address[4][0].split('%')[0])
+        if not ip.is_global or ip.is_multicast:
+            raise ValueError(f'Refusing to fetch from non-public address {ip}')
+    return addresses[0][4][0]
+
+
+def check_public_url(url):
+    """Raise ValueError unless url is http(s) and its host resolves only to public addresses"""
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError('Only http(s) image URLs can be cached')
+    public_address(parts.hostname)
+
+
+def pinned_connection(connection_class):
+    """
+    Connection factory that resolves and checks the host itself, then connects
+    to exactly that address. Resolving again inside urllib would let a
+    DNS-rebinding host pass the check and then point at 127.0.0.1.
+    The Host header, SNI and certificate check still use the original hostname.
+    """
+    def create(host, **kwargs):
+        conn = connection_class(host, **kwargs)
+        address = public_address(conn.host)
+        conn._create_connection = lambda target, *args, **kw: socket.create_connection(
+            (address, target[1]), *args, **kw)
+        return conn
+    return create
+
+
+class PinnedHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(pinned_connection(http.client.HTTPConnection), req)
+
+
+class PinnedHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(pinned_connection(http.client.HTTPSConnection), req,
+                            context=self._context)
+
+
+class PublicRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Refuse redirects to non-http(s) URLs or private hosts before following them"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_public_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+# No proxies: the pinned connection must go straight to the checked address
+image_opener = urllib.request.build_opener(
+    urllib.request.ProxyHandler({}), PinnedHTTPHandler, PinnedHTTPSHandler, PublicRedirectHandler)
+
+
+def download_image(url):
+    """Fetch a raster image from a public http(s) URL and shrink it when Pillow is installed"""
+    check_public_url(url)
+    with image_opener.open(url, timeout=THUMBNAIL_FETCH_TIMEOUT) as response:
+        content = response.read(THUMBNAIL_MAX_DOWNLOAD + 1)
+    if len(content) > THUMBNAIL_MAX_DOWNLOAD:
+        raise ValueError('Image is too large to cache')
+    content_type = raster_type(content)
+    if content_type is None:
+        raise ValueError('URL did not return a JPEG, PNG, GIF or WebP image')
+
+    if Image is not None:
+        image = Image.open(io.BytesIO(content))
+        image.thumbnail(THUMBNAIL_SIZE)
+        output = io.BytesIO()
+        image.convert('RGB').save(output, 'JPEG', quality=85)
+        content, content_type = output.getvalue(), 'image/jpeg'
+    return content, content_type
+
+
+def evict_thumbnails(cur, keep_url):
+    """Drop least-recently-used entries (never keep_url) until the cache fits THUMBNAIL_CACHE_BYTES"""
+    cur.execute('''
+        SELECT COALESCE(SUM(size), 0) AS total
+        FROM (SELECT MAX(size) AS size FROM thumbnails GROUP BY digest)
+    ''')
+    total = cur.fetchone()['total']
+    if total <= THUMBNAIL_CACHE_BYTES:
+        return
+    cur.execute('SELECT url, digest, size FROM thumbnails WHERE url != ? ORDER BY last_access', (keep_url,))
+    for row in cur.fetchall():
+        if total <= THUMBNAIL_CACHE_BYTES:
+            break
+        cur.execute('DELETE FROM thumbnails WHERE url = ?', (row['url'],))
+        cur.execute('SELECT 1 FROM thumbnails WHERE digest = ?', (row['digest'],))
+        if cur.fetchone() is None:
+            try:
+                os.remove(os.path.join(THUMBNAIL_DIR, row['digest']))
+            except FileNotFoundError:
+                pass
+            total -= row['size']
+
+
+def cached_thumbnail(cur, url):
+    """Digest of the cached thumbnail for url, downloading it on a miss"""
+    now = time.time()
+    cur.execute('SELECT digest FROM thumbnails WHERE url = ?', (url,))
+    row = cur.fetchone()
+    if row is not None and os.path.exists(os.path.join(THUMBNAIL_DIR, row['digest'])):
+        cur.execute('UPDATE thumbnails SET last_access = ? WHERE url = ? AND last_access < ?',
+                    (now, url, now - THUMBNAIL_TOUCH_SECONDS))
+        return row['digest']
+
+    content, content_type = download_image(url)
+    digest = hashlib.sha256(content).hexdigest()
+    path = os.path.join(THUMBNAIL_DIR, digest)
+    if not os.path.exists(path):
+        os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+
+    cur.execute('''
+        INSERT OR REPLACE INTO thumbnails (url, digest, size, content_type, last_access)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (url, digest, len(content), content_type, now))
+    evict_thumbnails(cur, url)
+    return digest
+
+
+@app.route('/api/products/<int:id>/thumbnail', methods=['GET'])
+def get_product_thumbnail(id):
+    """Redirect to the cached, immutable copy of the product's image"""
+    if not THUMBNAILS_ENABLED:
+        return jsonify({'error': 'Thumbnail cache is disabled'}), 404
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute('SELECT image_url FROM products WHERE id = ?', (id,))
+        product = cur.fetchone()
+        if product is None or not product['image_url']:
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'Product image not found'}), 404
+        try:
+            digest = cached_thumbnail(cur, product['image_url'])
+        except (ValueError, OSError) as e:
+            conn.rollback()
+            cur.close()
+            conn.close()
+            return jsonify({'error': f'Could not fetch image: {e}'}), 502
+        conn.commit()
+        cur.close()
+        conn.close()
+        response = redirect(f'/api/thumbnails/{digest}')
+        # Short lifetime: the product's image_url may change, the digest URL never does
+        response.headers['Cache-Control'] = 'public, max-age=300'
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/thumbnails/<digest>', methods=['GET'])
+def get_thumbnail(digest):
+    """Serve a cached thumbnail by content hash with long-lived cache headers"""
+    if not DIGEST_PATTERN.match(digest):
+        return jsonify({'error': 'Thumbnail not found'}), 404
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute('SELECT content_type FROM thumbnails WHERE digest = ? LIMIT 1', (digest,))
+        row = cur.fetchone()
+        cur.close()
+        conn.close()
+        if row is None or not os.path.exists(os.path.join(THUMBNAIL_DIR, digest)):
+            return jsonify({'error': 'Thumbnail not found'}), 404
+        response = send_from_directory(os.path.abspath(THUMBNAIL_DIR), digest,
+                                       mimetype=row['content_type'], max_age=31536000)
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 # ============================================
 # SUPPLIERS API
 # ============================================
@@ -219,7 +1025,7 @@ def get_supplier(id):
         conn.close()
         if supplier is None:
             return jsonify({'error': 'Supplier not found'}), 404
-        return jsonify(supplier)
+        return with_etag(supplier)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -248,10 +1054,11 @@ def create_supplier():
         supplier_id = cur.lastrowid
         cur.execute('SELECT * FROM suppliers WHERE id = ?', (supplier_id,))
         supplier = serialize_row(cur.fetchone())
+        record_change(cur, 'suppliers', supplier_id, 'insert', supplier)
         conn.commit()
         cur.close()
         conn.close()
-        return jsonify(supplier), 201
+        return with_etag(supplier, 201)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -260,13 +1067,18 @@ def create_supplier():
 def update_supplier(id):
     try:
         data = request.get_json()
+        try:
+            version = expected_version(data)
+        except ValueError:
+            return jsonify({'error': 'Invalid version or If-Match header'}), 400
         conn = get_db_connection()
         cur = conn.cursor()
         cur.execute('''
             UPDATE suppliers
             SET name = ?, contact_person = ?, email = ?, phone = ?,
-                address = ?, outstanding_balance = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
+                address = ?, outstanding_balance = ?,
+                version = version + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND (? IS NULL OR version = ?)
         ''', (
             data['name'],
             data.get('contact_person', ''),
@@ -274,16 +1086,35 @@ def update_supplier(id):
             data.get('phone', ''),
             data.get('address', ''),
             data.get('outstanding_balance', 0),
-            id
+            id,
+            version,
+            version
         ))
+        if cur.rowcount == 0:
+            cur.execute('SELECT 1 FROM suppliers WHERE id = ?', (id,))
+            exists = cur.fetchone() is not None
+            conn.rollback()
+            cur.close()
+            conn.close()
+            if exists:
+                return jsonify({'error': 'Version conflict - reload and retry'}), 412
+            return jsonify({'error': 'Supplier not found'}), 404
         cur.execute('SELECT * FROM suppliers WHERE id = ?', (id,))
         supplier = serialize_row(cur.fetchone())
+        record_change(cur, 'suppliers', id, 'update', supplier)
         conn.commit()
         cur.close()
         conn.close()
-        if supplier is None:
-            return jsonify({'error': 'Supplier not found'}), 404
-        return jsonify(supplier)
+        return with_etag(supplier)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/suppliers/<int:id>', methods=['PATCH'])
+def patch_supplier(id):
+    """Partial update - SQL: UPDATE suppliers SET <supplied columns> WHERE id = ? AND version = ?"""
+    try:
+        return patch_response('suppliers', id, SUPPLIER_PATCH_FIELDS, 'Supplier not found')
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -294,6 +1125,8 @@ def delete_supplier(id):
         conn = get_db_connection()
         cur = conn.cursor()
         cur.execute('DELETE FROM suppliers WHERE id = ?', (id,))
+        if cur.rowcount:
+            record_change(cur, 'suppliers', id, 'delete')
         conn.commit()
         cur.close()
         conn.close()
@@ -366,8 +1199,23 @@ def create_purchase():
     """Create purchase with items (transaction)"""
     try:
         data = request.get_json()
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
+        # A negative quantity would take stock out past the sale guard and the cart holds
+        if not valid_items(data.get('items')) or not valid_prices(data['items'], 'unit_price'):
+            return jsonify({'error': 'items need a product_id, a positive integer quantity '
+                                     'and a non-negative unit_price'}), 400
+
         conn = get_db_connection()
         cur = conn.cursor()
+
+        # Free with the in-memory index; without it, purchases skip this check as before
+        if CATALOG_INDEX_ENABLED:
+            missing = missing_products([item['product_id'] for item in data['items']])
+            if missing:
+                cur.close()
+                conn.close()
+                return jsonify({'error': 'Unknown product ids', 'product_ids': missing}), 400
         
         # Calculate totals
         subtotal = sum(item['quantity'] * item['unit_price'] for item in data['items'])
@@ -401,15 +1249,22 @@ def create_purchase():
             ''', (purchase_id, item['product_id'], item['quantity'], item['unit_price'], item_total))
 
             # Update product quantity
-            cur.execute('UPDATE products SET quantity = quantity + ? WHERE id = ?',
+            cur.execute('UPDATE products SET quantity = quantity + ?, version = version + 1 WHERE id = ?',
                        (item['quantity'], item['product_id']))
+            record_row_change(cur, 'products', item['product_id'], STOCK_CHANGE_COLUMNS)
 
             # Record stock movement
             cur.execute('''
                 INSERT INTO stock_movements (product_id, movement_type, quantity, reference_type, reference_id)
                 VALUES (?, 'purchase', ?, 'purchase', ?)
             ''', (item['product_id'], item['quantity'], purchase_id))
-        
+
+        record_change(cur, 'purchases', purchase_id, 'insert', {
+            'invoice_no': data['invoice_no'],
+            'supplier_id': data['supplier_id'],
+            'purchase_date': data['purchase_date'],
+            'total_amount': total_amount
+        })
         conn.commit()
         cur.close()
         conn.close()
@@ -419,6 +1274,177 @@ def create_purchase():
         return jsonify({'error': str(e)}), 500
 
 
+# ============================================
+# STOCK RESERVATIONS API
+# ============================================
+
+# Units of a product held by carts whose hold has not expired yet.
+# Expired holds stop counting immediately; the rows are purged lazily.
+RESERVED_SQL = '''
+    (SELECT COALESCE(SUM(h.quantity), 0) FROM stock_holds h
+     WHERE h.product_id = products.id AND h.expires_at > datetime('now'))
+'''
+
+DEFAULT_HOLD_SECONDS = 15 * 60
+MAX_HOLD_SECONDS = 24 * 60 * 60
+
+
+def availability(cur, product_id):
+    """Current on-hand, reserved and available quantity of one product"""
+    cur.execute(f'''
+        SELECT id AS product_id, quantity, {RESERVED_SQL} AS reserved
+        FROM products WHERE id = ?
+    ''', (product_id,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    result = dict(row)
+    result['available'] = result['quantity'] - result['reserved']
+    return result
+
+
+def take_stock(cur, product_id, quantity):
+    """
+    Atomically decrement stock only if enough unreserved units are left.
+    SQL: UPDATE products SET quantity = quantity - ? WHERE id = ? AND available >= ?
+    Returns True when the units were taken.
+    """
+    cur.execute(f'''
+        UPDATE products
+        SET quantity = quantity - ?, version = version + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND quantity - {RESERVED_SQL} >= ?
+    ''', (quantity, product_id, quantity))
+    return cur.rowcount == 1
+
+
+def shortage(cur, product_id, quantity):
+    """Per-item error entry for a line that could not be fulfilled"""
+    stock = availability(cur, product_id)
+    if stock is None:
+        return {'product_id': product_id, 'requested': quantity, 'error': 'Product not found'}
+    return {'product_id': product_id, 'requested': quantity,
+            'available': stock['available'], 'error': 'Insufficient stock'}
+
+
+def valid_items(items):
+    """True when items is a non-empty list of {product_id, quantity > 0}"""
+    return isinstance(items, list) and bool(items) and all(
+        isinstance(item, dict) and type(item.get('product_id')) is int
+        and type(item.get('quantity')) is int and item['quantity'] > 0
+        for item in items
+    )
+
+
+def valid_prices(items, key):
+    """True when every item has a non-negative number under key"""
+    return all(
+        type(item.get(key)) in (int, float) and item[key] >= 0
+        for item in items
+    )
+
+
+@app.route('/api/products/<int:id>/availability', methods=['GET'])
+def get_availability(id):
+    """On-hand vs reserved vs available quantity for one product"""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        stock = availability(cur, id)
+        cur.close()
+        conn.close()
+        if stock is None:
+            return jsonify({'error': 'Product not found'}), 404
+        return jsonify(stock)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/reservations', methods=['POST'])
+def create_reservation():
+    """
+    Place time-limited holds for a cart (all items or none).
+    Body: {"cart_id": "abc", "ttl_seconds": 900, "items": [{"product_id": 1, "quantity": 2}]}
+    """
+    try:
+        data = request.get_json()
+        cart_id = str(data.get('cart_id') or '')
+        if not cart_id or not valid_items(data.get('items')):
+            return jsonify({'error': 'cart_id and items with positive quantities are required'}), 400
+        try:
+            ttl = int(data.get('ttl_seconds', DEFAULT_HOLD_SECONDS))
+        except (TypeError, ValueError):
+            ttl = 0
+        if not 0 < ttl <= MAX_HOLD_SECONDS:
+            return jsonify({'error': f'ttl_seconds must be between 1 and {MAX_HOLD_SECONDS}'}), 400
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("DELETE FROM stock_holds WHERE expires_at <= datetime('now')")
+
+        failed = []
+        for item in data['items']:
+            cur.execute(f'''
+                INSERT INTO stock_holds (cart_id, product_id, quantity, expires_at)
+                SELECT ?, id, ?, datetime('now', ?)
+                FROM products
+                WHERE id = ? AND quantity - {RESERVED_SQL} >= ?
+            ''', (cart_id, item['quantity'], f'+{ttl} seconds', item['product_id'], item['quantity']))
+            if cur.rowcount == 0:
+                failed.append(shortage(cur, item['product_id'], item['quantity']))
+
+        if failed:
+            conn.rollback()
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'Could not reserve all items', 'items': failed}), 409
+
+        cur.execute('SELECT * FROM stock_holds WHERE cart_id = ? ORDER BY id', (cart_id,))
+        holds = [serialize_row(row) for row in cur.fetchall()]
+        conn.commit()
+        cur.close()
+        conn.close()
+        return jsonify({'cart_id': cart_id, 'holds': holds}), 201
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/reservations/<cart_id>', methods=['GET'])
+def get_reservation(cart_id):
+    """Active (unexpired) holds of a cart"""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute('''
+            SELECT h.*, p.name as product_name
+            FROM stock_holds h
+            JOIN products p ON h.product_id = p.id
+            WHERE h.cart_id = ? AND h.expires_at > datetime('now')
+            ORDER BY h.id
+        ''', (cart_id,))
+        holds = [serialize_row(row) for row in cur.fetchall()]
+        cur.close()
+        conn.close()
+        return jsonify({'cart_id': cart_id, 'holds': holds})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/reservations/<cart_id>', methods=['DELETE'])
+def release_reservation(cart_id):
+    """Release every hold of a cart"""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute('DELETE FROM stock_holds WHERE cart_id = ?', (cart_id,))
+        released = cur.rowcount
+        conn.commit()
+        cur.close()
+        conn.close()
+        return jsonify({'message': 'Reservation released', 'released': released}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 # ============================================
 # SALES API
 # ============================================
@@ -466,9 +1492,19 @@ def get_sale(id):
 
 @app.route('/api/sales', methods=['POST'])
 def create_sale():
-    """Create sale with items (transaction)"""
+    """
+    Create sale with items (transaction).
+    Stock is taken with a guarded UPDATE, so a sale never drives quantity below
+    what other carts hold; pass "cart_id" to convert that cart's holds into the sale.
+    """
     try:
         data = request.get_json()
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
+        if not valid_items(data.get('items')) or not valid_prices(data['items'], 'selling_price'):
+            return jsonify({'error': 'items need a product_id, a positive integer quantity '
+                                     'and a non-negative selling_price'}), 400
+
         conn = get_db_connection()
         cur = conn.cursor()
         
@@ -488,7 +1524,12 @@ def create_sale():
             total_amount
         ))
         sale_id = cur.lastrowid
-        
+
+        # The cart's own holds are released inside this transaction so they count as available
+        if data.get('cart_id'):
+            cur.execute('DELETE FROM stock_holds WHERE cart_id = ?', (str(data['cart_id']),))
+
+        failed = []
         for item in data['items']:
             item_total = item['quantity'] * item['selling_price']
             
@@ -498,14 +1539,28 @@ def create_sale():
             ''', (sale_id, item['product_id'], item['quantity'],
                   item.get('unit_price', item['selling_price']), item['selling_price'], item_total))
 
-            cur.execute('UPDATE products SET quantity = quantity - ? WHERE id = ?',
-                       (item['quantity'], item['product_id']))
+            if not take_stock(cur, item['product_id'], item['quantity']):
+                failed.append(shortage(cur, item['product_id'], item['quantity']))
+                continue
+            record_row_change(cur, 'products', item['product_id'], STOCK_CHANGE_COLUMNS)
 
             cur.execute('''
                 INSERT INTO stock_movements (product_id, movement_type, quantity, reference_type, reference_id)
                 VALUES (?, 'sale', ?, 'sale', ?)
             ''', (item['product_id'], -item['quantity'], sale_id))
-        
+
+        if failed:
+            conn.rollback()
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'Insufficient stock', 'items': failed}), 409
+
+        record_change(cur, 'sales', sale_id, 'insert', {
+            'invoice_no': data['invoice_no'],
+            'customer_name': data['customer_name'],
+            'sale_date': data['sale_date'],
+            'total_amount': total_amount
+        })
         conn.commit()
         cur.close()
         conn.close()
@@ -515,6 +1570,160 @@ def create_sale():
         return jsonify({'error': str(e)}), 500
 
 
+# ============================================
+# CHANGE FEED API
+# ============================================
+
+# Product columns that change when stock moves through a sale or purchase
+STOCK_CHANGE_COLUMNS = ['quantity', 'version']
+
+CHANGE_PAGE_SIZE = 500
+STREAM_POLL_SECONDS = 1
+STREAM_HEARTBEAT_SECONDS = 15
+
+
+def record_change(cur, entity, entity_id, op, payload=None):
+    """
+    Append to the change log inside the caller's transaction, so a change is
+    visible exactly when the write commits and seq follows commit order.
+    """
+    cur.execute('''
+        INSERT INTO change_log (entity, entity_id, op, payload)
+        VALUES (?, ?, ?, ?)
+    ''', (entity, entity_id, op, None if payload is None else json.dumps(payload)))
+
+
+def record_row_change(cur, table, id, columns):
+    """Log an 'update' whose payload is the current value of the given columns only"""
+    pairs = ', '.join(f"'{column}', {column}" for column in columns)
+    cur.execute(f'''
+        INSERT INTO change_log (entity, entity_id, op, payload)
+        SELECT ?, id, 'update', json_object('id', id, {pairs}) FROM {table} WHERE id = ?
+    ''', (table, id))
+
+
+def fetch_changes(cur, since, entity=None, limit=CHANGE_PAGE_SIZE, until=None):
+    """Changes with since < seq [<= until], oldest first"""
+    sql = 'SELECT * FROM change_log WHERE seq > ?'
+    params = [since]
+    if until is not None:
+        sql += ' AND seq <= ?'
+        params.append(until)
+    if entity:
+        sql += ' AND entity = ?'
+        params.append(entity)
+    sql += ' ORDER BY seq LIMIT ?'
+    params.append(limit)
+    cur.execute(sql, params)
+    changes = []
+    for row in cur.fetchall():
+        change = serialize_row(row)
+        change['payload'] = json.loads(change['payload']) if change['payload'] else None
+        changes.append(change)
+    return changes
+
+
+def latest_seq(cur):
+    """Last seq handed out; read from sqlite_sequence so it survives pruning the whole log"""
+    cur.execute("SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'change_log'), 0) AS seq")
+    return cur.fetchone()['seq']
+
+
+def log_pruned_past(cur, since):
+    """True when changes after since were already pruned, so a reader at since must reload in full"""
+    cur.execute('SELECT MIN(seq) AS seq FROM change_log')
+    oldest = cur.fetchone()['seq']
+    if oldest is None:
+        return since < latest_seq(cur)
+    return since + 1 < oldest
+
+
+@app.route('/api/changes', methods=['GET'])
+def get_changes():
+    """
+    Catch-up feed: GET /api/changes?since=<seq>[&entity=products][&limit=500]
+    Keep the returned last_seq and pass it as since on the next call.
+    410 with "reset": true means changes after since were pruned: reload the
+    full lists, then continue from the returned last_seq.
+    """
+    try:
+        since = request.args.get('since', 0, type=int)
+        limit = max(1, min(request.args.get('limit', CHANGE_PAGE_SIZE, type=int), CHANGE_PAGE_SIZE))
+        entity = request.args.get('entity')
+        conn = get_db_connection()
+        cur = conn.cursor()
+        # Bound the page by the log end read first, so last_seq never skips
+        # a change committed while this request was running
+        until = latest_seq(cur)
+        if log_pruned_past(cur, since):
+            cur.close()
+            conn.close()
+            return jsonify({
+                'error': 'Changes after since were pruned - reload the full list',
+                'reset': True,
+                'last_seq': until
+            }), 410
+        changes = fetch_changes(cur, since, entity, limit, until)
+        has_more = len(changes) == limit
+        cur.close()
+        conn.close()
+        return jsonify({
+            'changes': changes,
+            'last_seq': changes[-1]['seq'] if has_more else max(since, until),
+            'has_more': has_more
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/changes/stream', methods=['GET'])
+def stream_changes():
+    """
+    Server-Sent Events push feed. Resumes after the Last-Event-ID header
+    (sent automatically by EventSource on reconnect) or ?since=<seq>;
+    without either it starts at the current end of the log.
+    A "reset" event means changes were pruned before they could be sent:
+    reload the full lists; the stream then continues from its id.
+    """
+    entity = request.args.get('entity')
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', type=int)
+
+    def events(since):
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            if since is None:
+                since = latest_seq(cur)
+            yield 'retry: 3000\n\n'
+            idle = 0
+            while True:
+                if log_pruned_past(cur, since):
+                    since = latest_seq(cur)
+                    yield f"id: {since}\nevent: reset\ndata: {json.dumps({'last_seq': since})}\n\n"
+                changes = fetch_changes(cur, since, entity)
+                for change in changes:
+                    since = change['seq']
+                    yield f"id: {since}\nevent: change\ndata: {json.dumps(change)}\n\n"
+                if changes:
+                    idle = 0
+                    continue
+                time.sleep(STREAM_POLL_SECONDS)
+                idle += STREAM_POLL_SECONDS
+                if idle >= STREAM_HEARTBEAT_SECONDS:
+                    idle = 0
+                    yield ': keep-alive\n\n'
+        finally:
+            cur.close()
+            conn.close()
+
+    return Response(events(since), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
 # ============================================
 # DASHBOARD API
 # ============================================
@@ -593,10 +1802,582 @@ def get_chart_data():
         return jsonify({'error': str(e)}), 500
 
 
+# ============================================
+# BACKGROUND JOBS
+# ============================================
+
+# Heavy maintenance and report work runs here instead of inside a request.
+# Jobs live in the same database (no external broker): a pool of worker
+# threads claims queued rows, a scheduler thread enqueues cron schedules,
+# and clients follow progress through /api/jobs/<id>.
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_POLL_SECONDS = 5
+# A running job's heartbeat_at is refreshed every JOB_HEARTBEAT_SECONDS by the
+# process running it; a job not heard from for JOB_LEASE_SECONDS is failed
+JOB_HEARTBEAT_SECONDS = 15
+JOB_LEASE_SECONDS = 120
+SCHEDULER_POLL_SECONDS = 30
+EXPORT_DIR = os.getenv('EXPORT_DIR', 'exports')
+JOB_WORKER_ID = f'{socket.gethostname()}:{os.getpid()}'
+
+job_wakeup = threading.Event()
+running_job_ids = set()
+running_job_ids_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    """Raised inside a task when the job was cancelled through the API"""
+
+
+class JobContext:
+    """What a running task gets: its params, a DB connection and progress reporting"""
+
+    def __init__(self, job_id, params, conn):
+        self.id = job_id
+        self.params = params
+        self.conn = conn
+
+    def progress(self, done, total=None, message=None):
+        """Record progress (0..1, or done/total) and stop here if cancellation was requested"""
+        fraction = done / total if total else done
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute('''
+            UPDATE jobs SET progress = ?, message = COALESCE(?, message), heartbeat_at = datetime('now')
+            WHERE id = ?
+        ''', (min(max(fraction, 0), 1), message, self.id))
+        cur.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (self.id,))
+        cancelled = cur.fetchone()['cancel_requested']
+        conn.commit()
+        cur.close()
+        conn.close()
+        if cancelled:
+            raise JobCancelled()
+
+
+def task_optimize(job):
+    """ANALYZE / PRAGMA optimize, plus VACUUM when params.vacuum is true"""
+    cur = job.conn.cursor()
+    job.progress(0, message='Analyzing')
+    cur.execute('ANALYZE')
+    cur.execute('PRAGMA optimize')
+    if job.params.get('vacuum'):
+        job.progress(0.5, message='Vacuuming')
+        cur.execute('VACUUM')
+    cur.close()
+    return {'vacuumed': bool(job.params.get('vacuum'))}
+
+
+def task_reconcile_stock(job):
+    """
+    Compare products.quantity with the stock_movements log. The implied opening
+    stock (quantity minus all logged movements) can never be negative, so a
+    negative value or a negative quantity points at an unlogged stock change.
+    """
+    cur = job.conn.cursor()
+    cur.execute('''
+        SELECT p.id, p.sku, p.quantity, COALESCE(SUM(m.quantity), 0) AS movement_total
+        FROM products p
+        LEFT JOIN stock_movements m ON m.product_id = p.id
+        GROUP BY p.id
+        ORDER BY p.id
+    ''')
+    rows = cur.fetchall()
+    mismatches = []
+    for index, row in enumerate(rows, 1):
+        opening = row['quantity'] - row['movement_total']
+        if row['quantity'] < 0 or opening < 0:
+            mismatches.append({**dict(row), 'implied_opening': opening})
+        if index % 500 == 0:
+            job.progress(index, len(rows))
+    cur.close()
+    return {'checked': len(rows), 'mismatches': mismatches}
+
+
+def task_prune(job):
+    """Delete expired stock holds and change log entries older than params.keep_days (default 30)"""
+    keep_days = int(job.params.get('keep_days', 30))
+    cur = job.conn.cursor()
+    cur.execute("DELETE FROM stock_holds WHERE expires_at <= datetime('now')")
+    holds = cur.rowcount
+    cur.execute("DELETE FROM change_log WHERE created_at < datetime('now', ?)", (f'-{keep_days} days',))
+    changes = cur.rowcount
+    job.conn.commit()
+    cur.close()
+    return {'stock_holds': holds, 'change_log': changes}
+
+
+def task_export_products(job):
+    """Write the product list to a CSV file in EXPORT_DIR"""
+    cur = job.conn.cursor()
+    cur.execute('SELECT COUNT(*) AS total FROM products')
+    total = cur.fetchone()['total']
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    filename = f'products-{job.id}.csv'
+    path = os.path.join(EXPORT_DIR, filename)
+    cur.execute(f'SELECT {", ".join(PRODUCT_COLUMNS)} FROM products ORDER BY id')
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(PRODUCT_COLUMNS)
+        written = 0
+        while True:
+            rows = cur.fetchmany(1000)
+            if not rows:
+                break
+            writer.writerows(tuple(row) for row in rows)
+            written += len(rows)
+            job.progress(written, total)
+    cur.close()
+    return {'rows': written, 'file': filename, 'url': f'/api/exports/{filename}'}
+
+
+JOB_TASKS = {
+    'optimize': task_optimize,
+    'reconcile_stock': task_reconcile_stock,
+    'prune': task_prune,
+    'export_products': task_export_products,
+}
+
+
+def serialize_job(row):
+    job = serialize_row(row)
+    for key in ('params', 'result'):
+        job[key] = json.loads(job[key]) if job[key] else None
+    job['cancel_requested'] = bool(job['cancel_requested'])
+    return job
+
+
+def enqueue_job(cur, task, params=None, run_at=None, schedule_name=None):
+    """
+    Insert a queued job; run_at is a UTC 'YYYY-MM-DD HH:MM:SS' string (default: now).
+    Call job_wakeup.set() after committing so an idle worker picks it up at once.
+    """
+    cur.execute('''
+        INSERT INTO jobs (task, params, run_at, schedule_name)
+        VALUES (?, ?, COALESCE(?, datetime('now')), ?)
+    ''', (task, json.dumps(params or {}), run_at, schedule_name))
+    return cur.lastrowid
+
+
+def claim_job(cur):
+    """
+    Atomically move the oldest due job from queued to running (safe across processes).
+    The UPDATE tags the row with a one-off claim id, which the SELECT then looks
+    up; this avoids UPDATE ... RETURNING, which needs SQLite 3.35+.
+    """
+    claim = f'{JOB_WORKER_ID}/{uuid.uuid4().hex[:12]}'
+    cur.execute('''
+        UPDATE jobs
+        SET status = 'running', started_at = datetime('now'), heartbeat_at = datetime('now'), worker = ?
+        WHERE id = (
+            SELECT id FROM jobs
+            WHERE status = 'queued' AND run_at <= datetime('now')
+            ORDER BY run_at, id
+            LIMIT 1
+        ) AND status = 'queued'
+    ''', (claim,))
+    if cur.rowcount == 0:
+        return None
+    cur.execute("SELECT id, task, params FROM jobs WHERE worker = ? AND status = 'running'", (claim,))
+    return cur.fetchone()
+
+
+def finish_job(job_id, status, result=None, error=None):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('''
+        UPDATE jobs
+        SET status = ?, result = ?, error = ?, finished_at = datetime('now'),
+            progress = CASE WHEN ? = 'succeeded' THEN 1 ELSE progress END
+        WHERE id = ?
+    ''', (status, None if result is None else json.dumps(result), error, status, job_id))
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def run_job(row):
+    job_id = row['id']
+    task = JOB_TASKS.get(row['task'])
+    if task is None:
+        finish_job(job_id, 'failed', error=f"Unknown task: {row['task']}")
+        return
+    conn = get_db_connection()
+    with running_job_ids_lock:
+        running_job_ids.add(job_id)
+    try:
+        result = task(JobContext(job_id, json.loads(row['params'] or '{}'), conn))
+        finish_job(job_id, 'succeeded', result)
+    except JobCancelled:
+        conn.rollback()
+        finish_job(job_id, 'cancelled')
+    except Exception as e:
+        conn.rollback()
+        finish_job(job_id, 'failed', error=str(e))
+    finally:
+        with running_job_ids_lock:
+            running_job_ids.discard(job_id)
+        conn.close()
+
+
+def job_worker():
+    """Worker thread: claim and run jobs until the process exits"""
+    while True:
+        try:
+            conn = get_db_connection()
+            cur = conn.cursor()
+            row = claim_job(cur)
+            conn.commit()
+            cur.close()
+            conn.close()
+        except sqlite3.Error:
+            app.logger.exception('Could not claim a background job')
+            row = None
+        if row is None:
+            job_wakeup.wait(JOB_POLL_SECONDS)
+            job_wakeup.clear()
+            continue
+        run_job(row)
+
+
+def parse_cron_field(field, low, high):
+    """Set of values matched by one cron field: *, */n, a-b, a-b/n and comma lists"""
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/')
+            step = int(step)
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(value) for value in part.split('-'))
+        else:
+            start = end = int(part)
+        if start < low or end > high or step < 1:
+            raise ValueError(f'Cron value out of range: {field}')
+        values.update(range(start, end + 1, step))
+    return values
+
+
+CRON_ALIASES = {
+    '@hourly': '0 * * * *',
+    '@daily': '0 0 * * *',
+    '@weekly': '0 0 * * 0',
+    '@monthly': '0 0 1 * *',
+}
+
+
+def next_cron_time(expression, after):
+    """First minute after `after` (a naive UTC datetime) matching a 5-field cron expression"""
+    fields = CRON_ALIASES.get(expression, expression).split()
+    if len(fields) != 5:
+        raise ValueError('Cron expression needs 5 fields: minute hour day month weekday')
+    minutes = parse_cron_field(fields[0], 0, 59)
+    hours = parse_cron_field(fields[1], 0, 23)
+    days = parse_cron_field(fields[2], 1, 31)
+    months = parse_cron_field(fields[3], 1, 12)
+    weekdays = {day % 7 for day in parse_cron_field(fields[4], 0, 7)}  # 0 and 7 are Sunday
+    any_day, any_weekday = fields[2] == '*', fields[4] == '*'
+
+    candidate = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    limit = candidate + timedelta(days=366 * 5)
+    while candidate < limit:
+        day_match = candidate.day in days
+        weekday_match = (candidate.weekday() + 1) % 7 in weekdays
+        if any_day or any_weekday:
+            date_match = day_match and weekday_match
+        else:
+            date_match = day_match or weekday_match
+        if candidate.month not in months or not date_match:
+            candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+        elif candidate.hour not in hours:
+            candidate = candidate.replace(minute=0) + timedelta(hours=1)
+        elif candidate.minute not in minutes:
+            candidate += timedelta(minutes=1)
+        else:
+            return candidate
+    raise ValueError(f'Cron expression never matches: {expression}')
+
+
+def run_due_schedules():
+    """Enqueue one job per due schedule; the guarded UPDATE stops two processes firing the same run"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    cur.execute("SELECT * FROM job_schedules WHERE enabled = 1 AND "
+                "(next_run_at IS NULL OR next_run_at <= datetime('now'))")
+    for schedule in cur.fetchall():
+        next_run = next_cron_time(schedule['cron'], now).strftime('%Y-%m-%d %H:%M:%S')
+        cur.execute('''
+            UPDATE job_schedules SET next_run_at = ?
+            WHERE name = ? AND next_run_at IS ?
+        ''', (next_run, schedule['name'], schedule['next_run_at']))
+        # A schedule seen for the first time is only armed, not run
+        if cur.rowcount and schedule['next_run_at'] is not None:
+            enqueue_job(cur, schedule['task'], json.loads(schedule['params'] or '{}'),
+                        schedule_name=schedule['name'])
+        conn.commit()
+        job_wakeup.set()
+    cur.close()
+    conn.close()
+
+
+def job_scheduler():
+    while True:
+        try:
+            run_due_schedules()
+        except (sqlite3.Error, ValueError):
+            app.logger.exception('Could not run due job schedules')
+        time.sleep(SCHEDULER_POLL_SECONDS)
+
+
+def renew_job_leases():
+    """Refresh heartbeat_at of the jobs this process is running"""
+    with running_job_ids_lock:
+        ids = list(running_job_ids)
+    if not ids:
+        return
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(f'''
+        UPDATE jobs SET heartbeat_at = datetime('now')
+        WHERE status = 'running' AND id IN ({', '.join('?' * len(ids))})
+    ''', ids)
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def fail_expired_jobs():
+    """Fail running jobs whose process stopped renewing their lease (crashed or was killed)"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('''
+        UPDATE jobs SET status = 'failed', error = 'Worker stopped responding',
+            finished_at = datetime('now')
+        WHERE status = 'running'
+          AND COALESCE(heartbeat_at, started_at) < datetime('now', ?)
+    ''', (f'-{JOB_LEASE_SECONDS} seconds',))
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def job_heartbeat():
+    """Heartbeat thread: keep this process's leases alive and release expired ones"""
+    while True:
+        try:
+            renew_job_leases()
+            fail_expired_jobs()
+        except sqlite3.Error:
+            app.logger.exception('Could not renew background job leases')
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+
+
+job_runner_lock = threading.Lock()
+job_runner_started = False
+
+
+def start_job_runner(workers=JOB_WORKERS):
+    """Start the worker pool and scheduler as daemon threads (once per process)"""
+    global job_runner_started
+    with job_runner_lock:
+        if job_runner_started:
+            return
+        job_runner_started = True
+    for index in range(workers):
+        threading.Thread(target=job_worker, name=f'job-worker-{index}', daemon=True).start()
+    threading.Thread(target=job_scheduler, name='job-scheduler', daemon=True).start()
+    threading.Thread(target=job_heartbeat, name='job-heartbeat', daemon=True).start()
+
+
+@app.before_request
+def start_job_runner_in_process():
+    """
+    Start the in-process runner on the first request, so it runs under any
+    server (with or without the reloader) and only in the process that serves
+    requests. JOB_WORKERS=0 leaves jobs to a `python backend_flask.py worker` sidecar.
+    """
+    if JOB_WORKERS > 0 and not job_runner_started:
+        start_job_runner()
+
+
+def parse_run_at(value):
+    """Client timestamp (ISO 8601, UTC if no offset) -> SQLite 'YYYY-MM-DD HH:MM:SS' in UTC"""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+@app.route('/api/jobs', methods=['GET'])
+def get_jobs():
+    """Recent jobs, newest first (?status=queued|running|succeeded|failed|cancelled)"""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        if request.args.get('status'):
+            cur.execute('SELECT * FROM jobs WHERE status = ? ORDER BY id DESC LIMIT 100',
+                        (request.args['status'],))
+        else:
+            cur.execute('SELECT * FROM jobs ORDER BY id DESC LIMIT 100')
+        jobs = [serialize_job(row) for row in cur.fetchall()]
+        cur.close()
+        conn.close()
+        return jsonify(jobs)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/jobs/<int:id>', methods=['GET'])
+def get_job(id):
+    """Job status, progress and result"""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute('SELECT * FROM jobs WHERE id = ?', (id,))
+        row = cur.fetchone()
+        cur.close()
+        conn.close()
+        if row is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(serialize_job(row))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """Queue a job. Body: {"task": "optimize", "params": {...}, "run_at": "2026-01-01T03:00:00Z"}"""
+    try:
+        data = request.get_json()
+        if data.get('task') not in JOB_TASKS:
+            return jsonify({'error': 'task must be one of: ' + ', '.join(JOB_TASKS)}), 400
+        try:
+            run_at = parse_run_at(data['run_at']) if data.get('run_at') else None
+        except ValueError:
+            return jsonify({'error': 'run_at must be an ISO 8601 timestamp'}), 400
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+        job_id = enqueue_job(cur, data['task'], data.get('params'), run_at)
+        cur.execute('SELECT * FROM jobs WHERE id = ?', (job_id,))
+        job = serialize_job(cur.fetchone())
+        conn.commit()
+        job_wakeup.set()
+        cur.close()
+        conn.close()
+        return jsonify(job), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/jobs/<int:id>/cancel', methods=['POST'])
+def cancel_job(id):
+    """Cancel a queued job at once; a running job stops at its next progress report"""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute('''
+            UPDATE jobs SET status = 'cancelled', cancel_requested = 1, finished_at = datetime('now')
+            WHERE id = ? AND status = 'queued'
+        ''', (id,))
+        cur.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (id,))
+        cur.execute('SELECT * FROM jobs WHERE id = ?', (id,))
+        row = cur.fetchone()
+        conn.commit()
+        cur.close()
+        conn.close()
+        if row is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(serialize_job(row))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/jobs/schedules', methods=['GET'])
+def get_job_schedules():
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute('SELECT * FROM job_schedules ORDER BY name')
+        schedules = [serialize_row(row) for row in cur.fetchall()]
+        for schedule in schedules:
+            schedule['params'] = json.loads(schedule['params']) if schedule['params'] else None
+        cur.close()
+        conn.close()
+        return jsonify(schedules)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/jobs/schedules', methods=['POST'])
+def save_job_schedule():
+    """Create or replace a schedule. Body: {"name": "nightly", "task": "optimize", "cron": "0 3 * * *"}"""
+    try:
+        data = request.get_json()
+        if not data.get('name') or data.get('task') not in JOB_TASKS:
+            return jsonify({'error': 'name and a valid task are required'}), 400
+        try:
+            next_run = next_cron_time(data.get('cron', ''), datetime.now(timezone.utc).replace(tzinfo=None))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute('''
+            INSERT OR REPLACE INTO job_schedules (name, task, cron, params, enabled, next_run_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (
+            data['name'],
+            data['task'],
+            data['cron'],
+            json.dumps(data.get('params') or {}),
+            1 if data.get('enabled', True) else 0,
+            next_run.strftime('%Y-%m-%d %H:%M:%S')
+        ))
+        cur.execute('SELECT * FROM job_schedules WHERE name = ?', (data['name'],))
+        schedule = serialize_row(cur.fetchone())
+        schedule['params'] = json.loads(schedule['params'])
+        conn.commit()
+        cur.close()
+        conn.close()
+        return jsonify(schedule), 201
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/jobs/schedules/<name>', methods=['DELETE'])
+def delete_job_schedule(name):
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute('DELETE FROM job_schedules WHERE name = ?', (name,))
+        conn.commit()
+        cur.close()
+        conn.close()
+        return jsonify({'message': 'Schedule deleted'}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/exports/<filename>', methods=['GET'])
+def get_export(filename):
+    """Download a file written by an export job"""
+    return send_from_directory(os.path.abspath(EXPORT_DIR), filename, as_attachment=True)
+
+
 # ============================================
 # RUN SERVER
 # ============================================
 if __name__ == '__main__':
+    if sys.argv[1:] == ['worker']:
+        # Sidecar mode: python backend_flask.py worker
+        print(f"Starting background job runner with {max(JOB_WORKERS, 1)} workers...")
+        start_job_runner(max(JOB_WORKERS, 1))
+        threading.Event().wait()
+
     print("Starting Inventory Management API Server...")
     print("API running at: http://localhost:3001")
     app.run(host='0.0.0.0', port=3001, debug=True)
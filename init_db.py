@@ -29,6 +29,7 @@ def init_database():
             reorder_level INTEGER DEFAULT 10,
             image_url TEXT,
             description TEXT,
+            version INTEGER DEFAULT 1,
             created_at TEXT DEFAULT CURRENT_TIMESTAMP,
             updated_at TEXT DEFAULT CURRENT_TIMESTAMP
         )
@@ -44,6 +45,7 @@ def init_database():
             phone TEXT,
             address TEXT,
             outstanding_balance REAL DEFAULT 0,
+            version INTEGER DEFAULT 1,
             created_at TEXT DEFAULT CURRENT_TIMESTAMP,
             updated_at TEXT DEFAULT CURRENT_TIMESTAMP
         )
@@ -125,6 +127,78 @@ def init_database():
         )
     ''')
 
+    # Create stock_holds table (time-limited cart reservations)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stock_holds (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cart_id TEXT NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            expires_at TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_holds_product ON stock_holds (product_id, expires_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_holds_cart ON stock_holds (cart_id)')
+
+    # Create change_log table (feed of inventory changes for /api/changes)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            payload TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Create thumbnails table (index of the local product image cache)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS thumbnails (
+            url TEXT PRIMARY KEY,
+            digest TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            content_type TEXT,
+            last_access REAL NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_thumbnails_last_access ON thumbnails (last_access)')
+
+    # Create jobs and job_schedules tables (background job runner)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task TEXT NOT NULL,
+            params TEXT,
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress REAL DEFAULT 0,
+            message TEXT,
+            result TEXT,
+            error TEXT,
+            cancel_requested INTEGER DEFAULT 0,
+            schedule_name TEXT,
+            worker TEXT,
+            run_at TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            started_at TEXT,
+            finished_at TEXT,
+            heartbeat_at TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, run_at)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_schedules (
+            name TEXT PRIMARY KEY,
+            task TEXT NOT NULL,
+            cron TEXT NOT NULL,
+            params TEXT,
+            enabled INTEGER DEFAULT 1,
+            next_run_at TEXT
+        )
+    ''')
+
     # Insert sample data for products
     products_data = [
         ('Wireless Mouse', 'WM-001', 'Electronics', 150, 29.99, 20, 'https://images.unsplash.com/photo-1527864550417-7fd91fc51a46?w=400'),
@@ -156,7 +230,7 @@ def init_database():
     conn.close()
 
     print("Database initialized successfully!")
-    print("Created tables: products, suppliers, purchases, purchase_items, sales, sale_items, stock_movements")
+    print("Created tables: products, suppliers, purchases, purchase_items, sales, sale_items, stock_movements, stock_holds, change_log, thumbnails, jobs, job_schedules")
     print("Inserted sample data for products and suppliers")
     print("Database file: inventory_new.db")
 